@@ -0,0 +1,163 @@
+"""Ядра расчета траекторий лучей на Dr.Jit (CUDA, либо LLVM на CPU)"""
+import drjit as dr
+import numpy as np
+
+if dr.has_backend(dr.JitBackend.CUDA):
+    import drjit.cuda as backend
+else:
+    import drjit.llvm as backend
+
+UInt32 = backend.UInt32
+
+# Индексы в плоских буферах результатов имеют тип UInt32
+_MAX_INDEX = 2**32
+# Начальное состояние PCG32 по умолчанию
+_PCG32_STATE = 0x853c49e6748fea9b
+
+
+def trace_cyl(startpoints, vectors, R, z_max, termination_threshold, diffusion, max_refl, dtype=np.float64):
+    """Рассчет траекторий лучей в цилиндрическом волокне одним ядром Dr.Jit
+
+    Все лучи трассируются в одном символьном цикле `drjit.while_loop`, который
+    компилируется в единое ядро для GPU (или CPU через LLVM). Если плоский буфер
+    N * max_refl * 3 не адресуется индексами UInt32, лучи считаются частями.
+
+    Parameters
+    ----------
+    startpoints : `numpy.ndarray` [[`float`]]
+        Массив начальных точек лучей, форма (N, 3), метры
+    vectors : `numpy.ndarray` [[`float`]]
+        Массив единичных направляющих векторов лучей, форма (N, 3)
+    R : `float`
+        Радиус сердцевины, метры
+    z_max : `float`
+        Длина волокна, метры
+    termination_threshold : `float`
+        Порог pi/2 - arcsin(clad_n/core_n) для |n·v| (угол в радианах, а не косинус), выше которого
+        луч уничтожается; значение больше 1 отключает проверку
+    diffusion : `float`
+        Угол диффузного отражения, радианы, 0.0 без диффузии
+    max_refl : `int`
+        Максимальное количество отражений
+    dtype : `numpy.dtype`, optional
+        Тип чисел состояния лучей, `numpy.float32` или `numpy.float64`, by default numpy.float64
+
+    Returns
+    -------
+    `numpy.ndarray` [[[`float`]]]
+        Массив координат отражения, форма (N, max_refl, 3), метры
+    `numpy.ndarray` [[[`float`]]]
+        Массив углов распространения, форма (N, max_refl, 3), радианы
+    `numpy.ndarray` [`int`]
+        Количество отражений каждого луча
+    `numpy.ndarray` [`int`]
+        Коды причин уничтожения (0 - max_reflections, 1 - z_max, 2 - reflection_angle)
+    """
+    row = max_refl * 3
+    if row >= _MAX_INDEX:
+        raise ValueError(f'max_refl = {max_refl} is too large for UInt32 buffer indices')
+    N = len(startpoints)
+    chunk = (_MAX_INDEX - 1) // row
+    if N <= chunk:
+        return _trace_cyl_chunk(startpoints, vectors, R, z_max, termination_threshold, diffusion, max_refl, dtype, 0)
+    dots = np.empty((N, max_refl, 3), dtype=dtype)
+    angles = np.empty((N, max_refl, 3), dtype=dtype)
+    nrefl = np.empty(N, dtype=np.int64)
+    term = np.empty(N, dtype=np.int64)
+    for start in range(0, N, chunk):
+        part = slice(start, start + chunk)
+        dots[part], angles[part], nrefl[part], term[part] = _trace_cyl_chunk(
+            startpoints[part], vectors[part], R, z_max, termination_threshold, diffusion, max_refl, dtype, start)
+    return dots, angles, nrefl, term
+
+
+def _trace_cyl_chunk(startpoints, vectors, R, z_max, termination_threshold, diffusion, max_refl, dtype, first_ray):
+    """Рассчет одной части лучей для `trace_cyl`; `first_ray` задает номер потока PCG32 первого луча"""
+    if np.dtype(dtype) == np.float32:
+        Float, next_float = backend.Float, backend.PCG32.next_float32
+    else:
+        Float, next_float = backend.Float64, backend.PCG32.next_float64
+    N = len(startpoints)
+    inv_R = 1.0 / R
+    x, y, z = (Float(startpoints[:, k]) for k in range(3))
+    vx, vy, vz = (Float(vectors[:, k]) for k in range(3))
+    ray = dr.arange(UInt32, N)
+    latitude = dr.acos(vz)
+    # dr.atan2 и dr.maximum не собираются LLVM 15 (fmaximum), поэтому азимут в ядре не
+    # считается: сохраняются горизонтальные компоненты направления до диффузии
+    # и диффузное смещение азимута, atan2 берется в numpy после расчета
+    dots = dr.zeros(Float, N * max_refl * 3)
+    angles = dr.zeros(Float, N * max_refl * 3)
+    dirs = dr.zeros(Float, N * max_refl * 2)
+    base = ray * (max_refl * 3)
+    for k, value in enumerate((x, y, z)):
+        dr.scatter(dots, value, base + k)
+    dr.scatter(angles, latitude, base + 1)
+    dr.scatter(dirs, vx, ray * (max_refl * 2))
+    dr.scatter(dirs, vy, ray * (max_refl * 2) + 1)
+    # Конструктор PCG32 прибавляет номер луча в части к initstate и initseq, поэтому со сдвигом
+    # на first_ray поток каждого луча задается его общим номером и не зависит от разбиения на части
+    rng = backend.PCG32(size=N, initstate=_PCG32_STATE + first_ray, initseq=first_ray)
+
+    def cond(x, y, z, vx, vy, vz, hx, hy, offset, latitude, reflection_angle, i, nrefl, term, rng):
+        return (i < max_refl) & (term == 0)
+
+    def body(x, y, z, vx, vy, vz, hx, hy, offset, latitude, reflection_angle, i, nrefl, term, rng):
+        a = vx*vx + vy*vy
+        b = vx*x + vy*y
+        c = x*x + y*y - R*R
+        d = b*b - a*c
+        s = dr.select(a > 0, (-b + dr.sqrt(dr.select(d > 0, d, 0))) / a, 0)
+        out = (a == 0) | (z + vz*s > z_max)
+        t = (z_max - z) / vz
+        px = dr.select(out, x + vx*t, x + vx*s)
+        py = dr.select(out, y + vy*t, y + vy*s)
+        pz = dr.select(out, z_max, z + vz*s)
+        # n = -[x, y, 0]/R, n_z = 0 и vz при отражении не меняется
+        dot = -(px*vx + py*vy) * inv_R
+        rvx = vx + 2*dot*inv_R*px
+        rvy = vy + 2*dot*inv_R*py
+        nvx, nvy, nvz = rvx, rvy, vz
+        new_offset = dr.zeros(Float, N)
+        new_latitude = dr.acos(vz)
+        if diffusion:
+            new_offset = (next_float(rng) - 0.5) * 2 * diffusion
+            new_latitude += (next_float(rng) - 0.5) * 2 * diffusion
+            # Поворот горизонтального направления на new_offset вместо sincos(atan2(rvy, rvx) + new_offset);
+            # на оси atan2 дает 0, и направление задается одним смещением
+            h = dr.sqrt(rvx*rvx + rvy*rvy)
+            sd, cd = dr.sincos(new_offset)
+            ca = dr.select(h > 0, (rvx*cd - rvy*sd) / h, cd)
+            sa = dr.select(h > 0, (rvy*cd + rvx*sd) / h, sd)
+            sl, cl = dr.sincos(new_latitude)
+            nvx, nvy, nvz = sl*ca, sl*sa, cl
+        idx = ray * (max_refl * 3) + i * 3
+        dr.scatter(dots, px, idx)
+        dr.scatter(dots, py, idx + 1)
+        dr.scatter(dots, pz, idx + 2)
+        dr.scatter(angles, dr.select(out, offset, new_offset), idx)
+        dr.scatter(angles, dr.select(out, latitude, new_latitude), idx + 1)
+        dr.scatter(angles, dr.select(out, dr.abs(reflection_angle), dr.abs(dot)), idx + 2)
+        idx2 = ray * (max_refl * 2) + i * 2
+        dr.scatter(dirs, dr.select(out, hx, rvx), idx2)
+        dr.scatter(dirs, dr.select(out, hy, rvy), idx2 + 1)
+        # Без диффузии |n·v| сохраняется между отражениями, проверяется только первое
+        dead = ~out & (dr.abs(dot) > termination_threshold)
+        if not diffusion:
+            dead &= i == 1
+        term = dr.select(out, 1, dr.select(dead, 2, term))
+        nrefl = dr.select(out | dead, i + 1, nrefl)
+        return (px, py, pz, nvx, nvy, nvz, rvx, rvy, new_offset, new_latitude, dot, i + 1, nrefl, term, rng)
+
+    state = dr.while_loop(
+        state=(x, y, z, vx, vy, vz, Float(vx), Float(vy), dr.zeros(Float, N), latitude, Float(latitude),
+               dr.full(UInt32, 1, N), dr.full(UInt32, max_refl, N), dr.zeros(UInt32, N), rng),
+        cond=cond,
+        body=body,
+    )
+    nrefl, term = state[12], state[13]
+    angles = angles.numpy().reshape(N, max_refl, 3)
+    dirs = dirs.numpy().reshape(N, max_refl, 2)
+    angles[:, :, 0] += np.arctan2(dirs[:, :, 1], dirs[:, :, 0])
+    return (dots.numpy().reshape(N, max_refl, 3), angles,
+            nrefl.numpy().astype(np.int64), term.numpy().astype(np.int64))
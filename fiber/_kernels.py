@@ -0,0 +1,102 @@
+"""Скомпилированные (Numba) ядра расчета траекторий лучей"""
+import numpy as np
+from numba import njit, prange
+
+
+@njit(cache=True, fastmath=True, parallel=True)
+def trace_cyl(x0, y0, z0, vx, vy, vz, R, z_max, termination_threshold, diffusion, max_refl,
+              dots_out, angles_out, nrefl_out, term_out):
+    """Рассчет траекторий лучей в цилиндрическом волокне, по лучу на поток
+
+    Parameters
+    ----------
+    x0, y0, z0 : `numpy.ndarray` [`float`]
+        Координаты начальных точек лучей, метры
+    vx, vy, vz : `numpy.ndarray` [`float`]
+        Компоненты единичных направляющих векторов лучей
+    R : `float`
+        Радиус сердцевины, метры
+    z_max : `float`
+        Длина волокна, метры
+    termination_threshold : `float`
+        Порог pi/2 - arcsin(clad_n/core_n) для |n·v| (угол в радианах, а не косинус), выше которого
+        луч уничтожается; значение больше 1 отключает проверку
+    diffusion : `float`
+        Угол диффузного отражения, радианы, 0.0 без диффузии
+    max_refl : `int`
+        Максимальное количество отражений
+    dots_out : `numpy.ndarray` [[[`float`]]]
+        Выходной массив координат отражения, форма (N, max_refl, 3)
+    angles_out : `numpy.ndarray` [[[`float`]]]
+        Выходной массив углов распространения, форма (N, max_refl, 3), радианы
+    nrefl_out : `numpy.ndarray` [`int`]
+        Выходной массив количества отражений
+    term_out : `numpy.ndarray` [`int`]
+        Выходной массив кодов причин уничтожения (0 - max_reflections, 1 - z_max, 2 - reflection_angle)
+    """
+    N = x0.shape[0]
+    # Константы в типе входных массивов, чтобы расчет во float32 не повышался до float64
+    real = x0.dtype.type
+    half = real(0.5)
+    two = real(2.0)
+    inv_R = real(1.0) / R
+    for r in prange(N):
+        x, y, z = x0[r], y0[r], z0[r]
+        ux, uy, uz = vx[r], vy[r], vz[r]
+        azimut = np.arctan2(uy, ux)
+        latitude = np.arccos(uz)
+        reflection_angle = latitude
+        dots_out[r, 0, 0] = x
+        dots_out[r, 0, 1] = y
+        dots_out[r, 0, 2] = z
+        angles_out[r, 0, 0] = azimut
+        angles_out[r, 0, 1] = latitude
+        angles_out[r, 0, 2] = 0.0
+        nrefl_out[r] = max_refl
+        term_out[r] = 0
+        for i in range(1, max_refl):
+            a = ux*ux + uy*uy
+            b = ux*x + uy*y
+            c = x*x + y*y - R*R
+            s = real(0.0)
+            if a > 0.0:
+                # Отрицательный дискриминант от округления на стенке обрезается до нуля
+                s = (-b + np.sqrt(max(b*b - a*c, real(0.0)))) / a
+            if a == 0.0 or z + uz*s > z_max:
+                t = (z_max - z) / uz
+                dots_out[r, i, 0] = x + ux*t
+                dots_out[r, i, 1] = y + uy*t
+                dots_out[r, i, 2] = z_max
+                angles_out[r, i, 0] = azimut
+                angles_out[r, i, 1] = latitude
+                angles_out[r, i, 2] = abs(reflection_angle)
+                nrefl_out[r] = i + 1
+                term_out[r] = 1
+                break
+            x = x + ux*s
+            y = y + uy*s
+            z = z + uz*s
+            # n = -[x, y, 0]/R, n_z = 0 и vz при отражении не меняется
+            dot = -(x*ux + y*uy) * inv_R
+            ux += two*dot*inv_R*x
+            uy += two*dot*inv_R*y
+            azimut = np.arctan2(uy, ux)
+            latitude = np.arccos(uz)
+            if diffusion > 0.0:
+                azimut += (real(np.random.random()) - half) * two * diffusion
+                latitude += (real(np.random.random()) - half) * two * diffusion
+                ux = np.sin(latitude) * np.cos(azimut)
+                uy = np.sin(latitude) * np.sin(azimut)
+                uz = np.cos(latitude)
+            reflection_angle = dot
+            dots_out[r, i, 0] = x
+            dots_out[r, i, 1] = y
+            dots_out[r, i, 2] = z
+            angles_out[r, i, 0] = azimut
+            angles_out[r, i, 1] = latitude
+            angles_out[r, i, 2] = abs(dot)
+            # Без диффузии |n·v| сохраняется между отражениями, проверяется только первое
+            if (i == 1 or diffusion > 0.0) and abs(dot) > termination_threshold:
+                nrefl_out[r] = i + 1
+                term_out[r] = 2
+                break
@@ -1,4 +1,6 @@
 """Имплементация волокон"""
+import math
+
 import numpy as np
 
 
@@ -131,9 +133,9 @@ class Fiber_cylinder:
         `numpy.ndarray` [`float`]
             Единичный вектор нормали к поверхности, направленной к центру цилиндра, метры
         """        
-        x, y = intersection_point[:2]
-        result = -1 * np.array([x, y, 0])/np.sqrt(x**2 + y**2)
-        return result # Возвращает нормаль к поверхности, направленную к центру цилиндра
+        # Точка лежит на стенке, поэтому sqrt(x**2 + y**2) = core_r
+        inv_r = 1.0 / self.core_r
+        return np.array((-intersection_point[0]*inv_r, -intersection_point[1]*inv_r, 0.0)) # Возвращает нормаль к поверхности, направленную к центру цилиндра
 
 class Fiber_cone:
     """Класс конического волокна
@@ -199,10 +201,11 @@ class Fiber_cone:
         """         
         self.diffusion = diffusion
         self.z_max = z_max
-        self.angle = np.arcsin((base_r - top_r) / z_max)
+        self.angle = math.asin((base_r - top_r) / z_max)
         self.base_r = base_r
         self.top_r = top_r
-        self.c = np.sin(self.angle) / np.cos(self.angle)
+        self.c = math.tan(self.angle)
+        self._update_angle_terms()
         self.core_n = core_n
         self.clad_n = clad_n
     def set_geometry(self, z_max = 1, base_r = 0, top_r = 0):
@@ -219,9 +222,15 @@ class Fiber_cone:
         """        
         self.base_r = base_r
         self.top_r = top_r
-        self.angle = np.arcsin((base_r - top_r) / z_max)
+        self.angle = math.asin((base_r - top_r) / z_max)
         self.z_max = z_max
-        self.c = np.sin(self.angle) / np.cos(self.angle)
+        self.c = math.tan(self.angle)
+        self._update_angle_terms()
+    def _update_angle_terms(self):
+        """Пересчитать тригонометрические величины угла раствора, используемые в `find_normal`"""
+        self._tan2 = self.c**2
+        # c**2 * (base_r/c) без деления на c, чтобы работал и случай c = 0
+        self._c_base = self.c * self.base_r
     def set_refr(self, core_n, clad_n):
         """Задать показатели преломления волокна
 
@@ -259,7 +268,7 @@ class Fiber_cone:
             Единичный вектор нормали, направленной к оси конуса
         """        
         x, y = intersection_point[:2]
-        z = -self.c**2*(intersection_point[2] - self.base_r / self.c)
+        z = self._c_base - self._tan2*intersection_point[2]
         result = -1 * np.array([x, y, z])/np.sqrt(x**2 + y**2 + z**2)
         return result # Возвращает нормаль к поверхности, направленную к центру цилиндра
     def find_radius(self, z):
@@ -33,10 +33,10 @@ def create_cone(xs, ys, zs, r_base, z_max, angle, n_slices = 40):
     theta = np.linspace(0, 2 * np.pi, n_slices + 1)
     r_top = r_base - (z_max-zs) * np.sin(angle)
     r1 = np.linspace(r_base, r_top, n_slices + 1)
-    x = np.array([xs + r1[i] * np.cos(theta) for i in range(len(r1))]).flatten()
-    y = np.array([ys + r1[i] * np.sin(theta) for i in range(len(r1))]).flatten()
+    x = (xs + r1[:, None] * np.cos(theta)[None, :]).ravel()
+    y = (ys + r1[:, None] * np.sin(theta)[None, :]).ravel()
     z_init = np.linspace(0, z_max-zs, n_slices + 1)
-    z = np.array([z_init[i] * np.ones(len(theta)) for i in range(len(r1))]).flatten()
+    z = np.repeat(z_init, len(theta))
     return x, y, z
 
 def show_trajectory_cone(data, index, fiber, n_slices = 40):
@@ -18,14 +18,13 @@ def cylinder_mesh(r, xs, ys, zs, h, n_slices=40):
 # index of the final point in the mesh
     n = n_slices * 2 + 1
 
-    # build triangulation
-    triangles = []
-    for s in range(1, n_slices + 1):
-        j = (s + 1) if (s <= n_slices - 1) else 1
-        k = j + n_slices if (s <= n_slices - 1) else n_slices + 1
-        l = s + n_slices
-        triangles += slice_triangles(0, n, s, j, k, l)
-    triangles = np.array(triangles)
+    # build triangulation for all slices at once
+    s = np.arange(1, n_slices + 1)
+    j = np.where(s <= n_slices - 1, s + 1, 1)
+    k = np.where(s <= n_slices - 1, j + n_slices, n_slices + 1)
+    l = s + n_slices
+    triangles = np.array(slice_triangles(np.zeros_like(s), np.full_like(s, n), s, j, k, l))
+    triangles = triangles.transpose(2, 0, 1).reshape(-1, 3)
 
     # coordinates of the vertices
     x_coords = np.hstack([xs, x[:-1], x[:-1], xs])
@@ -1,4 +1,6 @@
 """Содержит класс, описывающий распространение луча в коническом волокне"""
+import math
+
 import numpy as np
 
 class Ray_cone:
@@ -91,16 +93,10 @@ class Ray_cone:
         `numpy.ndarray` [`float`]
             Массив углов распространения [азимуталььный, зенитный]
         """  
-        latitude = np.arccos(vector[2])
-        if latitude == 0:
-            return [0, 0]
-        cos = vector[0] / np.linalg.norm(vector[:2])
-        sin = vector[1] / np.linalg.norm(vector[:2])
-        if sin > 0:
-            azimut = np.arccos(cos)
-        else:
-            azimut = -np.arccos(cos)
-        return [azimut, latitude]
+        # На оси (vx = vy = 0) atan2 дает 0, отдельная ветка не нужна
+        azimut = math.atan2(vector[1], vector[0])
+        latitude = math.acos(min(1.0, max(-1.0, vector[2])))
+        return np.array([azimut, latitude])
     
     def calculate_intersection(self, base_radius, c):
         """Рассчет точки  пересечения луча с поверхностью
@@ -117,21 +113,21 @@ class Ray_cone:
         `numpy.ndarray` [`float`]
             Координаты пересечения луча с поверхностью сердцевины
         """
-        a = base_radius/c
         if self.latitude == 0:
             return [*self.startpoint[:2], -1]
         x0, y0, z0 = self.startpoint
-        phi, alpha = self.azimut, self.latitude
-        gamma = np.cos(phi)*x0 + np.sin(phi)*y0
-        A = np.sin(alpha)**2 - np.cos(alpha)**2 * c**2
-        B = np.sin(alpha) * gamma - np.cos(alpha) * (z0 - a) * c**2
-        C = x0**2 + y0**2 - c**2 * (z0 - a)**2
-        t = (-B + np.sqrt(B**2 - A * C)) / A
-        x = x0 + np.cos(phi) * np.sin(alpha) * t
-        y = y0 + np.sin(phi) * np.sin(alpha) * t
-        z = z0 + np.cos(alpha) * t
+        # Компоненты вектора заменяют cos(phi)*sin(alpha), sin(phi)*sin(alpha), cos(alpha)
+        vx, vy, vz = self.vector
+        c2 = c*c
+        # Радиус конуса на высоте z0: c*(base_radius/c - z0) без деления на c,
+        # поэтому нецелевой случай c = 0 (цилиндр) тоже считается
+        r0 = base_radius - c*z0
+        A = vx*vx + vy*vy - vz*vz * c2
+        B = vx*x0 + vy*y0 + vz * c * r0
+        C = x0*x0 + y0*y0 - r0*r0
+        t = (-B + math.sqrt(max(B*B - A*C, 0.0))) / A
 
-        return [x, y, z]
+        return [x0 + vx*t, y0 + vy*t, z0 + vz*t]
     
     def calculate_reflection(self, point, normal):
         """Функция рассчитывает углы распространения луча после отражения в заданной точке
@@ -170,8 +166,9 @@ class Ray_cone:
         `numpy.ndarray` [`float`]
             Координаты начала луча
         """ 
-        phi = np.random.random() * np.pi
-        r = np.random.random() * radius
+        # Равномерное распределение по площади круга
+        phi = np.random.random() * 2 * np.pi
+        r = np.sqrt(np.random.random()) * radius
         coords = [r*np.cos(phi), r*np.sin(phi)]
         self.startpoint = [*coords, 0]
         return [*coords, 0]
@@ -1,6 +1,16 @@
 """Содержит класс, описывающий распространение луча в цилиндрическом волокне"""
+import math
+
 import numpy as np
 
+# Причины прекращения распространения луча по кодам, которые возвращают скомпилированные ядра
+TERMINATIONS = ('max_reflections', 'z_max', 'reflection_angle')
+
+def _trajectory_result(Dots, Angles, count, reason):
+    """Обрезать массивы траектории до `count` заполненных строк и перевести углы в градусы"""
+    Angles = Angles[:count]
+    return Dots[:count], np.rad2deg(Angles, out=Angles), count, reason
+
 class Ray_cylinder:
     """Класс конического волокна
 
@@ -14,11 +24,17 @@ class Ray_cylinder:
         Начальная координата луча
     vector : `numpy.ndarray` [`float`]
         Единичный вектор направления распространения луча
+
+    Массивы `startpoint` и `vector` перезаписываются на месте при каждом отражении
+    в `calculate_trajectory`, поэтому сохраненные ссылки на них меняются вместе с лучом;
+    для сохранения значения нужна копия.
     
     Методы
     ------
     `set_values`(self, azimut, latitude, startpoint):
         Задает параметры луча
+    `set_vector`(self, vector, startpoint):
+        Задает направляющий вектор и начальную точку луча без пересчета углов
     `calculate_angles_from_vector`(self, vector):
         Считает азимутальный и зенитный углы из направляющего вектора
     `calculate_intersection`(self, core_radius):
@@ -33,8 +49,10 @@ class Ray_cylinder:
         Генерация случайных углов распространения
     `set_angles`(self, azimut, latitude):
         Задание определенных углов распределения
-    `calculate_trajectory`(self, fiber, max_reflection = 1000, angle_elimination = True, output = False):
+    `calculate_trajectory`(self, fiber, max_reflection = 1000, angle_elimination = True, output = False, out_dots = None, out_angles = None):
         Рассчет траектории луча в заданной среде
+    `calculate_trajectory_jit`(self, fiber, max_reflection = 1000, angle_elimination = True, dtype = np.float64):
+        Рассчет траектории луча скомпилированным ядром
     """  
     azimut : float
     latitude : float
@@ -55,10 +73,19 @@ class Ray_cylinder:
         """             
         self.azimut = azimut
         self.latitude = latitude
-        self.startpoint = startpoint
-        self.vector = [np.sin(latitude)*np.cos(azimut),
-                      np.sin(latitude)*np.sin(azimut), 
-                      np.cos(latitude)]
+        # Вектор и начальная точка хранятся в собственных массивах и обновляются на месте
+        self.startpoint = np.empty(3)
+        self.startpoint[:] = startpoint
+        self.vector = np.empty(3)
+        self._update_vector_from_angles()
+
+    def _update_vector_from_angles(self):
+        """Пересчитать направляющий вектор из углов `azimut` и `latitude` на месте"""
+        sl, cl = math.sin(self.latitude), math.cos(self.latitude)
+        sa, ca = math.sin(self.azimut), math.cos(self.azimut)
+        self.vector[0] = sl*ca
+        self.vector[1] = sl*sa
+        self.vector[2] = cl
     
     def set_values(self, azimut, latitude, startpoint):
         """Задать параметры луча
@@ -74,10 +101,24 @@ class Ray_cylinder:
         """    
         self.azimut = azimut
         self.latitude = latitude
-        self.startpoint = startpoint
-        self.vector = [np.sin(latitude)*np.cos(azimut),
-                      np.sin(latitude)*np.sin(azimut), 
-                      np.cos(latitude)]
+        self.startpoint[:] = startpoint
+        self._update_vector_from_angles()
+
+    def set_vector(self, vector, startpoint):
+        """Задать направляющий вектор и начальную точку луча
+
+        Углы `azimut` и `latitude` не пересчитываются.
+
+        Parameters
+        ----------
+        vector : `numpy.ndarray` [`float`]
+            Единичный направляющий вектор, декартова СК
+        startpoint : `numpy.ndarray` [`float`]
+            Начальная точка луча, метры
+        """
+        self.vector[:] = vector
+        self.startpoint[:] = startpoint
+
     def calculate_angles_from_vector(self, vector):
         """Рассчет углов распространения на основе вектора распространения
 
@@ -91,15 +132,9 @@ class Ray_cylinder:
         `numpy.ndarray` [`float`]
             Массив углов распространения [азимуталььный, зенитный]
         """        
-        latitude = np.arccos(vector[2])
-        if latitude == 0:
-            return [0, 0]
-        cos = vector[0] / np.linalg.norm(vector[:2])
-        sin = vector[1] / np.linalg.norm(vector[:2])
-        if sin > 0:
-            azimut = np.arccos(cos)
-        else:
-            azimut = -np.arccos(cos)
+        # На оси (vx = vy = 0) atan2 дает 0, отдельная ветка не нужна
+        azimut = math.atan2(vector[1], vector[0])
+        latitude = math.acos(min(1.0, max(-1.0, vector[2])))
         return np.array([azimut, latitude])
     
     def calculate_intersection(self, core_radius):
@@ -115,20 +150,23 @@ class Ray_cylinder:
         `numpy.ndarray` [`float`]
             Координаты пересечения луча с поверхностью сердцевины
         """        
-        if self.latitude == 0:
-            return [*self.startpoint[:2], -1]
         x0, y0, z0 = self.startpoint
-        phi, alpha = self.azimut, self.latitude
+        vx, vy, vz = self.vector
         R = core_radius
-        gamma = np.cos(phi)*x0 + np.sin(phi)*y0
-        x = x0 + np.cos(phi) * (-gamma + np.sqrt(gamma**2 - x0**2 - y0**2 + R**2))
-        y = y0 + np.sin(phi) * (-gamma + np.sqrt(gamma**2 - x0**2 - y0**2 + R**2))
-        z = z0 + np.cos(alpha) / np.sin(alpha) * (-gamma + np.sqrt(gamma**2 - x0**2 - y0**2 + R**2))
+        # |p0 + v*t|_xy = R, квадратное уравнение относительно длины пути t
+        a = vx*vx + vy*vy
+        if a == 0:
+            return [x0, y0, -1]
+        b = vx*x0 + vy*y0
+        c = x0*x0 + y0*y0 - R*R
+        # Дискриминант считается один раз; max отсекает отрицательный ноль от округления на стенке
+        disc = b*b - a*c
+        t = (-b + math.sqrt(max(disc, 0.0))) / a
 
-        return [x, y, z]
+        return [x0 + vx*t, y0 + vy*t, z0 + vz*t]
     
     def calculate_reflection(self, point, normal):
-        """Функция рассчитывает углы распространения луча после отражения в заданной точке
+        """Функция рассчитывает направление распространения луча после отражения в заданной точке
 
         Parameters
         ----------
@@ -139,17 +177,15 @@ class Ray_cylinder:
 
         Returns
         -------
-        `float`
-            Азимутальный угол распространения вектора
-        `float`
-            Зенитный угол распространения вектора
+        `numpy.ndarray` [`float`]
+            Единичный направляющий вектор после отражения
         `float`
             Угол отражения
         """        
         angle  = np.dot(normal, self.vector)
         proection = normal * angle
         reflected_vector = -2 * proection + self.vector
-        return *self.calculate_angles_from_vector(reflected_vector), angle
+        return reflected_vector, angle
     
     def generate_startpoint(self, radius):
         """Создание случайной точки начала для луча в заданной области
@@ -164,10 +200,11 @@ class Ray_cylinder:
         `numpy.ndarray` [`float`]
             Координаты начала луча
         """        
-        phi = np.random.random() * np.pi
-        r = np.random.random() * radius
-        coords = [r*np.cos(phi), r*np.sin(phi)]
-        self.startpoint = [*coords, 0]
+        # Равномерное распределение по площади круга
+        phi = np.random.random() * 2 * np.pi
+        r = math.sqrt(np.random.random()) * radius
+        coords = [r*math.cos(phi), r*math.sin(phi)]
+        self.startpoint[:] = [*coords, 0]
         return np.array([*coords, 0])
     
     def set_startpoint(self, x = 0.0, y = 0.0, z = 0.0):
@@ -187,8 +224,10 @@ class Ray_cylinder:
         `numpy.ndarray` [`float`]
             Координаты заданной точки начала 
         """        
-        self.startpoint = [x, y, z]
-        return self.startpoint
+        self.startpoint[0] = x
+        self.startpoint[1] = y
+        self.startpoint[2] = z
+        return self.startpoint.copy()
     
     def generate_angles(self, max_latitude = 30.0):
         """Генерация случайных углов распространения для луча
@@ -205,13 +244,11 @@ class Ray_cylinder:
         `float`
             Азимутальный угол
         """        
-        latitude = np.deg2rad(np.random.random() * max_latitude)
-        azimut = np.deg2rad(np.random.random() * 360)
+        latitude = math.radians(np.random.random() * max_latitude)
+        azimut = math.radians(np.random.random() * 360)
         self.azimut = azimut
         self.latitude = latitude
-        self.vector = [np.sin(latitude)*np.cos(azimut),
-                      np.sin(latitude)*np.sin(azimut), 
-                      np.cos(latitude)]
+        self._update_vector_from_angles()
         return [latitude, azimut]
         
     def set_angles(self, azimut, latitude):
@@ -231,12 +268,10 @@ class Ray_cylinder:
         """        
         self.azimut = azimut
         self.latitude = latitude
-        self.vector = [np.sin(latitude)*np.cos(azimut),
-                      np.sin(latitude)*np.sin(azimut), 
-                      np.cos(latitude)]
+        self._update_vector_from_angles()
         return [latitude, azimut]
     
-    def calculate_trajectory(self, fiber, max_reflection = 1000, angle_elimination = True, output = False):
+    def calculate_trajectory(self, fiber, max_reflection = 1000, angle_elimination = True, output = False, out_dots = None, out_angles = None):
         """Рассчет траектории движения луча
 
         Parameters
@@ -249,48 +284,417 @@ class Ray_cylinder:
             Учитывать ли максимальный угол отражения, by default True
         output : `bool`, optional
             Дополнительный вывод, by default False
+        out_dots : `None` or `numpy.ndarray` [[`float`]], optional
+            Буфер (max_reflection, 3) для координат отражения, переиспользуется между вызовами, by default None
+        out_angles : `None` or `numpy.ndarray` [[`float`]], optional
+            Буфер (max_reflection, 3) для углов распространения, переиспользуется между вызовами, by default None
 
         Returns
         -------
         `numpy.ndarray` [[`float`]]
-            Массив координат отражения луча, метры
+            Массив координат отражения луча, только заполненные строки, метры
         `numpy.ndarray` [[`float`]]
-            Массив углов распространения после каждого отражения, радианы
+            Массив углов распространения после каждого отражения, только заполненные строки, градусы
         `int`
             Максимальное количество отражений
         `string`
             Причина, по которой луч перестал распространяться
         """        
         z_max = fiber.z_max
-        termination_angle = np.arcsin(fiber.clad_n / fiber.core_n)
-        Dots = np.zeros((max_reflection, 3))
+        termination_angle = math.asin(fiber.clad_n / fiber.core_n)
+        # Условие pi/2 - |n·v| < termination_angle, переписанное как сравнение |n·v| с порогом;
+        # порог - угол в радианах (как в исходной проверке), а не косинус критического угла
+        termination_threshold = np.pi / 2 - termination_angle
+        if out_dots is None:
+            Dots = np.zeros((max_reflection, 3))
+        else:
+            Dots = out_dots
+            Dots.fill(0)
+        if out_angles is None:
+            Angles = np.zeros((max_reflection, 3))
+        else:
+            Angles = out_angles
+            Angles.fill(0)
         reflection_angle = self.latitude
-        Angles = np.zeros((max_reflection, 3))
         z_start = self.startpoint[2]
         Dots[0] = self.startpoint
         Angles[0] = [self.azimut, self.latitude, 0]
+        if not fiber.diffusion and (self.vector[0] != 0 or self.vector[1] != 0):
+            return self._calculate_trajectory_closed(fiber, Dots, Angles, max_reflection,
+                                                     angle_elimination, termination_angle, output)
+        if fiber.diffusion:
+            # Случайные отклонения углов для всех отражений генерируются одним вызовом
+            diffusion = (np.random.random((max_reflection, 2)) - 0.5) * 2 * fiber.diffusion
         for i in range(1, max_reflection):
             intersection_point = self.calculate_intersection(fiber.core_r)
-            if intersection_point[2] > z_max:
+            # Осевой луч (vx = vy = 0) не пересекает стенку и выходит через торец, как в ядрах;
+            # calculate_intersection возвращает для него z = -1, и формула ниже дает точку на z_max
+            if intersection_point[2] > z_max or (self.vector[0] == 0 and self.vector[1] == 0):
                 intersection_final = intersection_point - self.vector / self.vector[2] * (intersection_point[2] - z_max) 
                 Dots[i] = intersection_final
                 Angles[i] = [self.azimut, self.latitude, abs(reflection_angle)]
                 if output:
                     print('Ray reached z_max.')
-                return Dots, np.rad2deg(Angles), i + 1, 'z_max'
+                return _trajectory_result(Dots, Angles, i + 1, 'z_max')
             normal = fiber.find_normal(intersection_point)
-            azimut, latitude, reflection_angle = self.calculate_reflection(intersection_point, normal)
+            reflected_vector, reflection_angle = self.calculate_reflection(intersection_point, normal)
+            azimut, latitude = self.calculate_angles_from_vector(reflected_vector)
             if fiber.diffusion:
-                azimut += (np.random.random() - 0.5 ) * 2 * fiber.diffusion
-                latitude += (np.random.random() - 0.5 ) * 2 * fiber.diffusion
+                azimut += diffusion[i, 0]
+                latitude += diffusion[i, 1]
+            cos_incidence = abs(reflection_angle)
             Dots[i] = intersection_point
-            Angles[i] = [azimut, latitude, abs(reflection_angle)]
-            if angle_elimination:
-                if np.pi / 2 - abs(reflection_angle) < termination_angle:
+            Angles[i] = [azimut, latitude, cos_incidence]
+            # Без диффузии |n·v| одинаков на всех отражениях в цилиндре (vz и хорда
+            # в плоскости xy сохраняются), поэтому угол достаточно проверить на первом
+            if angle_elimination and (i == 1 or fiber.diffusion):
+                if cos_incidence > termination_threshold:
                     if output:
-                        print('Ray terminated, termination angle: ', np.rad2deg(termination_angle),' reflection_angle: ',  np.rad2deg(np.pi / 2 - abs(reflection_angle)))
-                    return Dots, np.rad2deg(Angles), i + 1, 'reflection_angle'
-            self.set_values(azimut, latitude, intersection_point)
+                        print('Ray terminated, termination angle: ', np.rad2deg(termination_angle),' reflection_angle: ',  np.rad2deg(np.pi / 2 - cos_incidence))
+                    return _trajectory_result(Dots, Angles, i + 1, 'reflection_angle')
+            if fiber.diffusion:
+                self.set_values(azimut, latitude, intersection_point)
+            else:
+                self.set_vector(reflected_vector, intersection_point)
+                self.azimut, self.latitude = azimut, latitude
         if output:
             print('Reflections exceeded', max_reflection)
-        return Dots, np.rad2deg(Angles), max_reflection, 'max_reflections'
\ No newline at end of file
+        return _trajectory_result(Dots, Angles, max_reflection, 'max_reflections')
+
+    def _calculate_trajectory_closed(self, fiber, Dots, Angles, max_reflection, angle_elimination, termination_angle, output):
+        """Рассчет траектории луча в цилиндре без диффузии в замкнутом виде
+
+        Без диффузии все отражения повторяют первое: точка отражения поворачивается
+        вокруг оси на постоянный угол dphi и смещается по z на постоянный шаг dz,
+        поэтому траектория строится без цикла по отражениям.
+
+        Parameters
+        ----------
+        fiber : `Fiber_cylinder`
+            Класс описываемого волокна
+        Dots : `numpy.ndarray` [[`float`]]
+            Массив координат отражения с заполненной начальной точкой
+        Angles : `numpy.ndarray` [[`float`]]
+            Массив углов распространения с заполненными начальными углами
+        max_reflection : `int`
+            Максимальное количество отражений
+        angle_elimination : `bool`
+            Учитывать ли максимальный угол отражения
+        termination_angle : `float`
+            Предельный угол, радианы
+        output : `bool`
+            Дополнительный вывод
+
+        Returns
+        -------
+        То же, что и `calculate_trajectory`
+        """
+        z_max = fiber.z_max
+        reflection_angle = self.latitude
+        first_point = self.calculate_intersection(fiber.core_r)
+        n_hits = 0
+        if max_reflection > 1 and first_point[2] <= z_max:
+            normal = fiber.find_normal(first_point)
+            first_vector, reflection_angle = self.calculate_reflection(first_point, normal)
+            cos_incidence = abs(reflection_angle)
+            x1, y1, z1 = first_point
+            vx1, vy1, vz1 = first_vector
+            # Следующая точка на стенке: p1 + v1*ds, ds = -2 (v1·p1)_xy / |v1_xy|^2
+            ds = -2 * (vx1*x1 + vy1*y1) / (vx1*vx1 + vy1*vy1)
+            x2, y2 = x1 + vx1*ds, y1 + vy1*ds
+            dphi = math.atan2(x1*y2 - y1*x2, x1*x2 + y1*y2)
+            dz = vz1 * ds
+            n_hits = max_reflection - 1
+            if dz > 0:
+                n_hits = min(n_hits, int((z_max - z1) // dz) + 1)
+            terminated = angle_elimination and cos_incidence > np.pi / 2 - termination_angle
+            if terminated:
+                n_hits = 1
+            k = np.arange(n_hits)
+            cos_k, sin_k = np.cos(k * dphi), np.sin(k * dphi)
+            Dots[1:n_hits + 1, 0] = x1*cos_k - y1*sin_k
+            Dots[1:n_hits + 1, 1] = x1*sin_k + y1*cos_k
+            Dots[1:n_hits + 1, 2] = z1 + k*dz
+            vx = vx1*cos_k - vy1*sin_k
+            vy = vx1*sin_k + vy1*cos_k
+            Angles[1:n_hits + 1, 0] = np.arctan2(vy, vx)
+            Angles[1:n_hits + 1, 1] = self.calculate_angles_from_vector(first_vector)[1]
+            Angles[1:n_hits + 1, 2] = cos_incidence
+            if terminated:
+                if output:
+                    print('Ray terminated, termination angle: ', np.rad2deg(termination_angle),' reflection_angle: ',  np.rad2deg(np.pi / 2 - cos_incidence))
+                return _trajectory_result(Dots, Angles, 2, 'reflection_angle')
+            self.set_vector(np.array([vx[-1], vy[-1], vz1]), Dots[n_hits])
+            self.azimut, self.latitude = Angles[n_hits, :2]
+        i = n_hits + 1
+        if i >= max_reflection:
+            if output:
+                print('Reflections exceeded', max_reflection)
+            return _trajectory_result(Dots, Angles, max_reflection, 'max_reflections')
+        startpoint = np.asarray(self.startpoint, dtype=float)
+        Dots[i] = startpoint + self.vector * ((z_max - startpoint[2]) / self.vector[2])
+        Angles[i] = [self.azimut, self.latitude, abs(reflection_angle)]
+        if output:
+            print('Ray reached z_max.')
+        return _trajectory_result(Dots, Angles, i + 1, 'z_max')
+
+    def calculate_trajectory_jit(self, fiber, max_reflection = 1000, angle_elimination = True, dtype = np.float64):
+        """Рассчет траектории движения луча скомпилированным ядром (требует numba)
+
+        Parameters
+        ----------
+        fiber : `Fiber_cylinder`
+            Класс описываемого волокна
+        max_reflection : `int`, optional
+            Максимальное количество отражений, by default 1000
+        angle_elimination : `bool`, optional
+            Учитывать ли максимальный угол отражения, by default True
+        dtype : `numpy.dtype`, optional
+            Тип чисел при расчете; float64 воспроизводит `calculate_trajectory`, by default numpy.float64
+
+        Returns
+        -------
+        `numpy.ndarray` [[`float`]]
+            Массив координат отражения луча, метры
+        `numpy.ndarray` [[`float`]]
+            Массив углов распространения после каждого отражения, градусы
+        `int`
+            Максимальное количество отражений
+        `string`
+            Причина, по которой луч перестал распространяться
+        """
+        Dots, Angles, reflections, termination = trace_batch_jit(
+            fiber, [self.startpoint], [self.vector], max_reflection, angle_elimination, dtype=dtype)
+        count = int(reflections[0])
+        return Dots[0, :count], Angles[0, :count], count, termination[0]
+
+def generate_startpoints(N, radius):
+    """Создание N случайных точек начала лучей, равномерно распределенных по кругу
+
+    Parameters
+    ----------
+    N : `int`
+        Количество точек
+    radius : `float`
+        Радиус сердцевины волокна
+
+    Returns
+    -------
+    `numpy.ndarray` [[`float`]]
+        Координаты начала лучей, форма (N, 3)
+    """
+    u = np.random.random((N, 2))
+    r = radius * np.sqrt(u[:, 0])
+    phi = 2 * np.pi * u[:, 1]
+    points = np.empty((N, 3))
+    points[:, 0] = r * np.cos(phi)
+    points[:, 1] = r * np.sin(phi)
+    points[:, 2] = 0
+    return points
+
+
+def _batch_setup(fiber, N, max_reflection, angle_elimination, out_dots, out_angles):
+    """Подготовить буферы результатов и порог уничтожения для пакетного расчета лучей
+
+    Parameters
+    ----------
+    fiber : `Fiber_cylinder`
+        Класс описываемого волокна
+    N : `int`
+        Количество лучей
+    max_reflection : `int`
+        Максимальное количество отражений
+    angle_elimination : `bool`
+        Учитывать ли максимальный угол отражения
+    out_dots : `None` or `numpy.ndarray` [[[`float`]]]
+        Буфер для координат отражения или None
+    out_angles : `None` or `numpy.ndarray` [[[`float`]]]
+        Буфер для углов распространения или None
+
+    Returns
+    -------
+    `numpy.ndarray` [[[`float`]]]
+        Обнуленный массив координат отражения, форма (N, max_reflection, 3)
+    `numpy.ndarray` [[[`float`]]]
+        Обнуленный массив углов распространения, форма (N, max_reflection, 3)
+    `float`
+        Порог pi/2 - arcsin(clad_n/core_n) для |n·v|; 2.0 (проверка отключена) без `angle_elimination`
+    """
+    if out_dots is None:
+        Dots = np.zeros((N, max_reflection, 3))
+    else:
+        Dots = out_dots
+        Dots.fill(0)
+    if out_angles is None:
+        Angles = np.zeros((N, max_reflection, 3))
+    else:
+        Angles = out_angles
+        Angles.fill(0)
+    if angle_elimination:
+        termination_threshold = np.pi / 2 - np.arcsin(fiber.clad_n / fiber.core_n)
+    else:
+        termination_threshold = 2.0
+    return Dots, Angles, termination_threshold
+
+
+def trace_batch(fiber, startpoints, vectors, max_reflection = 1000, angle_elimination = True, out_dots = None, out_angles = None, dtype = np.float32):
+    """Рассчет траекторий множества лучей одновременно
+
+    Все лучи хранятся покомпонентно (x[N], y[N], z[N], vx[N], vy[N], vz[N])
+    и продвигаются синхронно, по одному отражению за итерацию.
+
+    Parameters
+    ----------
+    fiber : `Fiber_cylinder`
+        Класс описываемого волокна
+    startpoints : `numpy.ndarray` [[`float`]]
+        Массив начальных точек лучей, форма (N, 3), метры
+    vectors : `numpy.ndarray` [[`float`]]
+        Массив единичных направляющих векторов лучей, форма (N, 3)
+    max_reflection : `int`, optional
+        Максимальное количество отражений, by default 1000
+    angle_elimination : `bool`, optional
+        Учитывать ли максимальный угол отражения, by default True
+    out_dots : `None` or `numpy.ndarray` [[[`float`]]], optional
+        Буфер (N, max_reflection, 3) для координат отражения, переиспользуется между вызовами, by default None
+    out_angles : `None` or `numpy.ndarray` [[[`float`]]], optional
+        Буфер (N, max_reflection, 3) для углов распространения, переиспользуется между вызовами, by default None
+    dtype : `numpy.dtype`, optional
+        Тип чисел состояния лучей при расчете, `numpy.float64` для двойной точности, by default numpy.float32
+
+    Returns
+    -------
+    `numpy.ndarray` [[[`float`]]]
+        Массив координат отражения лучей, форма (N, max_reflection, 3), метры
+    `numpy.ndarray` [[[`float`]]]
+        Массив углов распространения после каждого отражения, форма (N, max_reflection, 3), градусы
+    `numpy.ndarray` [`int`]
+        Количество отражений каждого луча
+    `numpy.ndarray` [`string`]
+        Причина, по которой каждый луч перестал распространяться
+    """
+    # Состояние лучей и параметры волокна приводятся к одному типу, чтобы
+    # скаляры float64 не повышали точность массивов float32
+    real = np.dtype(dtype).type
+    startpoints = np.asarray(startpoints, dtype=dtype)
+    vectors = np.asarray(vectors, dtype=dtype)
+    N = len(startpoints)
+    R = real(fiber.core_r)
+    inv_R = 1 / R
+    z_max = real(fiber.z_max)
+    x, y, z = startpoints.T.copy()
+    vx, vy, vz = vectors.T.copy()
+    azimut = np.arctan2(vy, vx)
+    latitude = np.arccos(vz)
+    reflection_angle = latitude.copy()
+    Dots, Angles, termination_threshold = _batch_setup(fiber, N, max_reflection, angle_elimination, out_dots, out_angles)
+    Dots[:, 0] = startpoints
+    Angles[:, 0, 0] = azimut
+    Angles[:, 0, 1] = latitude
+    reflections = np.full(N, max_reflection)
+    termination = np.full(N, 'max_reflections', dtype=object)
+    active = np.ones(N, dtype=bool)
+    i = 1
+    while i < max_reflection and active.any():
+        idx = np.flatnonzero(active)
+        x0, y0, z0 = x[idx], y[idx], z[idx]
+        ux, uy, uz = vx[idx], vy[idx], vz[idx]
+        # Пересечение |p + v*s|_xy = R, решение квадратного уравнения относительно s
+        a = ux*ux + uy*uy
+        b = ux*x0 + uy*y0
+        c = x0*x0 + y0*y0 - R*R
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Дискриминант может стать отрицательным от округления на стенке (особенно во float32)
+            s = (-b + np.sqrt(np.maximum(b*b - a*c, 0))) / a
+            hx, hy, hz = x0 + ux*s, y0 + uy*s, z0 + uz*s
+        # Лучи, вышедшие за z_max, обрезаются по торцу волокна
+        out = ~(hz <= z_max)
+        if out.any():
+            o = idx[out]
+            t = (z_max - z0[out]) / uz[out]
+            Dots[o, i] = np.stack([x0[out] + ux[out]*t, y0[out] + uy[out]*t, np.full(len(o), z_max)], axis=1)
+            Angles[o, i] = np.stack([azimut[o], latitude[o], np.abs(reflection_angle[o])], axis=1)
+            reflections[o] = i + 1
+            termination[o] = 'z_max'
+            active[o] = False
+        keep = ~out
+        idx = idx[keep]
+        hx, hy, hz = hx[keep], hy[keep], hz[keep]
+        ux, uy, uz = ux[keep], uy[keep], uz[keep]
+        # Нормаль на стенке цилиндра n = -[x, y, 0]/R, отражение v' = v - 2(v·n)n;
+        # n_z = 0, поэтому vz при отражении не меняется
+        cos_incidence = -(hx*ux + hy*uy) * inv_R
+        scale = 2 * cos_incidence * inv_R
+        ux = ux + scale * hx
+        uy = uy + scale * hy
+        new_azimut = np.arctan2(uy, ux)
+        new_latitude = np.arccos(np.clip(uz, -1.0, 1.0))
+        if fiber.diffusion:
+            diffusion = (np.random.random((2, len(idx))) - 0.5) * 2 * fiber.diffusion
+            new_azimut += diffusion[0]
+            new_latitude += diffusion[1]
+            ux = np.sin(new_latitude) * np.cos(new_azimut)
+            uy = np.sin(new_latitude) * np.sin(new_azimut)
+            uz = np.cos(new_latitude)
+        Dots[idx, i, 0] = hx
+        Dots[idx, i, 1] = hy
+        Dots[idx, i, 2] = hz
+        Angles[idx, i, 0] = new_azimut
+        Angles[idx, i, 1] = new_latitude
+        abs_cos = np.abs(cos_incidence)
+        Angles[idx, i, 2] = abs_cos
+        # Без диффузии |n·v| сохраняется между отражениями, проверяется только первое
+        if angle_elimination and (i == 1 or fiber.diffusion):
+            dead = abs_cos > termination_threshold
+            reflections[idx[dead]] = i + 1
+            termination[idx[dead]] = 'reflection_angle'
+            active[idx[dead]] = False
+        x[idx], y[idx], z[idx] = hx, hy, hz
+        vx[idx], vy[idx], vz[idx] = ux, uy, uz
+        azimut[idx], latitude[idx] = new_azimut, new_latitude
+        reflection_angle[idx] = cos_incidence
+        i += 1
+    return Dots, np.rad2deg(Angles, out=Angles), reflections, termination
+
+
+def trace_batch_jit(fiber, startpoints, vectors, max_reflection = 1000, angle_elimination = True, out_dots = None, out_angles = None, dtype = np.float32):
+    """Рассчет траекторий множества лучей скомпилированным ядром `trace_cyl`
+
+    Принимает и возвращает то же, что и `trace_batch`. Требует установленного numba;
+    каждый луч трассируется в отдельном потоке до своего завершения.
+    """
+    from fiber._kernels import trace_cyl
+
+    real = np.dtype(dtype).type
+    # Покомпонентные непрерывные массивы (3, N)
+    startpoints = np.ascontiguousarray(np.asarray(startpoints).T, dtype=dtype)
+    vectors = np.ascontiguousarray(np.asarray(vectors).T, dtype=dtype)
+    N = startpoints.shape[1]
+    Dots, Angles, termination_threshold = _batch_setup(fiber, N, max_reflection, angle_elimination, out_dots, out_angles)
+    reflections = np.zeros(N, dtype=np.int64)
+    codes = np.zeros(N, dtype=np.int64)
+    trace_cyl(*startpoints, *vectors, real(fiber.core_r), real(fiber.z_max), termination_threshold,
+              real(fiber.diffusion or 0.0), max_reflection, Dots, Angles, reflections, codes)
+    termination = np.array(TERMINATIONS, dtype=object)[codes]
+    return Dots, np.rad2deg(Angles, out=Angles), reflections, termination
+
+
+def trace_batch_drjit(fiber, startpoints, vectors, max_reflection = 1000, angle_elimination = True, out_dots = None, out_angles = None, dtype = np.float32):
+    """Рассчет траекторий множества лучей одним ядром Dr.Jit на GPU (CUDA) или CPU (LLVM)
+
+    Принимает и возвращает то же, что и `trace_batch`. Требует установленного drjit.
+    Без CUDA используется LLVM-бэкенд; ядро не использует `dr.atan2` и `dr.maximum`,
+    которые LLVM 15 не может собрать (аварийное завершение процесса в нативном коде).
+    """
+    from fiber._drjit_kernels import trace_cyl
+
+    startpoints = np.ascontiguousarray(startpoints, dtype=dtype)
+    vectors = np.ascontiguousarray(vectors, dtype=dtype)
+    Dots, Angles, termination_threshold = _batch_setup(fiber, len(startpoints), max_reflection, angle_elimination, out_dots, out_angles)
+    dots, angles, reflections, codes = trace_cyl(startpoints, vectors, float(fiber.core_r), float(fiber.z_max),
+                                                 termination_threshold, float(fiber.diffusion or 0.0), max_reflection, dtype)
+    # Ядро возвращает новые массивы в типе dtype, результат копируется в буферы float64, как в `trace_batch`
+    Dots[...] = dots
+    Angles[...] = angles
+    termination = np.array(TERMINATIONS, dtype=object)[codes]
+    return Dots, np.rad2deg(Angles, out=Angles), reflections, termination